@@ -0,0 +1,61 @@
+from dataclasses import dataclass, field
+from typing import Set
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# --- Constants ---
+CASCADE_THRESHOLDS_PATH = "models/cascade_thresholds.json"
+SCREENING_IMAGE_SIZE = 128          # Input resolution of the cheap first stage
+DEFAULT_CONFIDENCE_THRESHOLD = 0.9  # Used until thresholds have been calibrated
+HIGH_RISK_CLASSES = {1, 4}          # Basal cell carcinoma and Melanoma always escalate
+
+
+@dataclass
+class CascadeConfig:
+    """
+    Settings for the two-stage cascade classifier.
+
+    The first stage is a reduced-resolution pass of the production model. Its
+    answer is accepted only when it is confident and not a high-risk class;
+    everything else escalates to the full-resolution pass and Grad-CAM.
+    """
+    confidence_threshold: float = DEFAULT_CONFIDENCE_THRESHOLD
+    high_risk_classes: Set[int] = field(default_factory=lambda: set(HIGH_RISK_CLASSES))
+    image_size: int = SCREENING_IMAGE_SIZE
+
+    def should_escalate(self, class_idx: int, confidence: float) -> bool:
+        """Whether a first-stage prediction needs the full model."""
+        return class_idx in self.high_risk_classes or confidence < self.confidence_threshold
+
+
+def save_cascade_config(config: CascadeConfig, path: str = CASCADE_THRESHOLDS_PATH):
+    """Writes thresholds in the format `load_cascade_config` reads."""
+    with open(path, "w") as f:
+        json.dump({
+            "confidence_threshold": config.confidence_threshold,
+            "high_risk_classes": sorted(config.high_risk_classes),
+            "image_size": config.image_size,
+        }, f, indent=2)
+
+
+def load_cascade_config(path: str = CASCADE_THRESHOLDS_PATH) -> CascadeConfig:
+    """
+    Loads the thresholds written by `scripts/calibrate_cascade.py`.
+
+    Falls back to conservative defaults if the file hasn't been generated.
+    """
+    if not os.path.exists(path):
+        logger.warning("No cascade thresholds found at %s; using uncalibrated defaults.", path)
+        return CascadeConfig()
+
+    with open(path) as f:
+        data = json.load(f)
+    logger.info("Loaded cascade thresholds from %s", path)
+    return CascadeConfig(
+        confidence_threshold=data["confidence_threshold"],
+        high_risk_classes=set(data.get("high_risk_classes", HIGH_RISK_CLASSES)),
+        image_size=data.get("image_size", SCREENING_IMAGE_SIZE),
+    )
@@ -1,8 +1,8 @@
-from typing import Set, Optional
+from typing import Annotated, Dict, Set, Optional
 import os
 
 from pydantic import field_validator, ValidationError
-from pydantic_settings import BaseSettings, SettingsConfigDict
+from pydantic_settings import BaseSettings, NoDecode, SettingsConfigDict
 
 
 class Settings(BaseSettings):
@@ -29,6 +29,45 @@ class Settings(BaseSettings):
     # The connection URL for the Redis instance.
     REDIS_URL: str
 
+    # --- Load Shedding ---
+    # The p95 latency target for /classify-lesion, in milliseconds.
+    SLO_LATENCY_MS: float = 1500.0
+
+    # The number of concurrent classification requests considered "full".
+    SLO_MAX_IN_FLIGHT: int = 8
+
+    # API keys that are rejected first when the service is overloaded.
+    # Example: LOW_PRIORITY_API_KEYS="key2,key3"
+    LOW_PRIORITY_API_KEYS: Annotated[Set[str], NoDecode] = set()
+
+    # --- Cascade Classifier ---
+    # When enabled, a cheap reduced-resolution pass screens each upload and
+    # only uncertain or high-risk cases run the full model and Grad-CAM.
+    CASCADE_ENABLED: bool = False
+
+    # --- Logging ---
+    LOG_LEVEL: str = "INFO"
+
+    # Per-logger fraction of DEBUG/INFO records to keep, as JSON.
+    # Example: LOG_SAMPLE_RATES='{"backend.streaming": 0.1}'
+    LOG_SAMPLE_RATES: Dict[str, float] = {}
+
+    # Per-logger maximum records per second, as JSON. Loggers not listed use
+    # LOG_DEFAULT_RATE_LIMIT (0 disables rate limiting).
+    # Example: LOG_RATE_LIMITS='{"backend.explainability": 2}'
+    LOG_RATE_LIMITS: Dict[str, float] = {}
+    LOG_DEFAULT_RATE_LIMIT: float = 50.0
+
+    @field_validator("LOW_PRIORITY_API_KEYS", mode="before")
+    @classmethod
+    def _parse_low_priority_api_keys(cls, v):
+        """Parse a comma-separated string of API keys into a (possibly empty) set."""
+        if v is None:
+            return set()
+        if isinstance(v, str):
+            return {key.strip() for key in v.split(",") if key.strip()}
+        return v
+
     @field_validator("API_KEYS", mode="before")
     @classmethod
     def _parse_api_keys(cls, v):
@@ -7,8 +7,7 @@ from torchcam.methods import GradCAM
 from torchcam.utils import overlay_mask
 from torchvision.transforms.functional import to_pil_image
 
-# --- Configuration ---
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
 
 # --- Constants ---
 HEATMAP_DIR = "heatmaps"
@@ -25,7 +24,7 @@ def generate_grad_cam_overlay(
     """
     Generates and saves a Grad-CAM heatmap overlay for a given image and model prediction.
     """
-    logging.info(f"Generating Grad-CAM heatmap for request_id: {request_id}")
+    logger.info("Generating Grad-CAM heatmap for request_id: %s", request_id)
 
     try:
         # Find the last convolutional layer of MobileNetV2 for Grad-CAM
@@ -46,18 +45,58 @@ def generate_grad_cam_overlay(
         heatmap_path = os.path.join(HEATMAP_DIR, f"{request_id}.png")
         result.save(heatmap_path)
         
-        logging.info(f"Grad-CAM heatmap saved to {heatmap_path}")
+        logger.info("Grad-CAM heatmap saved to %s", heatmap_path)
         return heatmap_path
 
     except Exception as e:
-        logging.error(f"Failed to generate Grad-CAM heatmap: {e}")
+        logger.error("Failed to generate Grad-CAM heatmap: %s", e)
         # As a fallback, save the original image so the endpoint doesn't fail
         fallback_path = os.path.join(HEATMAP_DIR, f"{request_id}.png")
         image.save(fallback_path)
-        logging.warning(f"Saved original image as fallback to {fallback_path}")
+        logger.warning("Saved original image as fallback to %s", fallback_path)
         return fallback_path
 
 
+def batch_grad_cam(
+    model: torch.nn.Module,
+    image_tensor: torch.Tensor,
+    with_cam: bool = True
+):
+    """
+    Classifies a batch of images and, optionally, computes a low-resolution
+    Grad-CAM for each image's predicted class in the same forward pass.
+
+    Samples in the batch are independent in eval mode, so differentiating the
+    sum of the selected scores gives each image its own gradients.
+
+    Returns:
+        A tuple of (probabilities, cams). `cams` is a tensor of shape
+        (batch, h, w) normalised to [0, 1] at the feature map resolution
+        (7x7 for a 224 px input), or None if `with_cam` is False.
+    """
+    if not with_cam:
+        with torch.no_grad():
+            return torch.nn.functional.softmax(model(image_tensor), dim=1), None
+
+    # Run MobileNetV2's forward pass by hand so we can keep hold of the
+    # feature maps without registering hooks of our own. Callers must still
+    # go through `run_on_model`, as torchcam's GradCAM does hook the model.
+    with torch.enable_grad():
+        features = model.features(image_tensor)
+        pooled = torch.nn.functional.adaptive_avg_pool2d(features, (1, 1)).flatten(1)
+        scores = model.classifier(pooled)
+        pred_class_idx = scores.argmax(dim=1)
+        selected = scores.gather(1, pred_class_idx.unsqueeze(1)).sum()
+        (gradients,) = torch.autograd.grad(selected, features)
+
+    weights = gradients.mean(dim=(2, 3), keepdim=True)
+    cams = torch.relu((weights * features).sum(dim=1)).detach()
+    # Normalise each map independently to [0, 1]
+    cams = cams / cams.flatten(1).amax(dim=1).clamp(min=1e-8).view(-1, 1, 1)
+
+    return torch.nn.functional.softmax(scores.detach(), dim=1), cams
+
+
 def generate_request_id() -> str:
     """Generates a unique request ID."""
     return str(uuid.uuid4())
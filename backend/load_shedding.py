@@ -0,0 +1,156 @@
+from collections import deque
+from contextlib import contextmanager
+from enum import IntEnum
+from typing import Callable, Optional, Set
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# --- Constants ---
+LATENCY_WINDOW_SIZE = 50      # Number of recent requests used to estimate latency
+LATENCY_MAX_AGE_SECONDS = 60  # Samples older than this no longer count
+LATENCY_PERCENTILE = 0.95     # The percentile compared against the SLO
+ESCALATE_THRESHOLD = 1.0      # Degrade when load exceeds this fraction of the SLO...
+RECOVER_THRESHOLD = 0.7       # ...and only recover once it falls below this fraction
+MIN_DWELL_SECONDS = 10.0      # Minimum time to stay at a level before changing again
+REDUCED_IMAGE_SIZE = 160      # Input resolution used once the service is under pressure
+
+
+class DegradationLevel(IntEnum):
+    """The stages the classification endpoint degrades through under load."""
+    NORMAL = 0              # Full inference plus an inline Grad-CAM heatmap
+    DEFER_GRAD_CAM = 1      # Grad-CAM is generated after the response is sent
+    REDUCED_RESOLUTION = 2  # Smaller input images and no Grad-CAM at all
+    SHED_LOW_PRIORITY = 3   # As above, and low-priority API keys are rejected
+
+
+class LoadShedder:
+    """
+    Adaptive controller that degrades the classification endpoint in stages.
+
+    Recent request latency and the number of in-flight requests are compared
+    against a configured SLO. The controller moves one level at a time, with
+    separate escalate/recover thresholds and a minimum dwell time so it does
+    not flap around the boundary.
+    """
+
+    def __init__(
+        self,
+        slo_latency_ms: float,
+        max_in_flight: int,
+        low_priority_keys: Optional[Set[str]] = None,
+        backlog: Callable[[], int] = lambda: 0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.slo_latency_ms = slo_latency_ms
+        self.max_in_flight = max_in_flight
+        self.low_priority_keys = low_priority_keys or set()
+        self.backlog = backlog
+        self._clock = clock
+        self._latencies_ms = deque(maxlen=LATENCY_WINDOW_SIZE)
+        self.in_flight = 0
+        self.level = DegradationLevel.NORMAL
+        self._last_change = float("-inf")
+
+    @classmethod
+    def from_settings(cls, settings, backlog: Callable[[], int] = lambda: 0) -> "LoadShedder":
+        """Builds a controller from the application settings."""
+        return cls(
+            slo_latency_ms=settings.SLO_LATENCY_MS,
+            max_in_flight=settings.SLO_MAX_IN_FLIGHT,
+            low_priority_keys=settings.LOW_PRIORITY_API_KEYS,
+            backlog=backlog,
+        )
+
+    def latency_percentile_ms(self) -> float:
+        """Returns the tracked latency percentile over the recent window."""
+        cutoff = self._clock() - LATENCY_MAX_AGE_SECONDS
+        while self._latencies_ms and self._latencies_ms[0][0] < cutoff:
+            self._latencies_ms.popleft()
+        if not self._latencies_ms:
+            return 0.0
+        ordered = sorted(latency for _, latency in self._latencies_ms)
+        index = min(int(len(ordered) * LATENCY_PERCENTILE), len(ordered) - 1)
+        return ordered[index]
+
+    def pressure(self) -> float:
+        """
+        Returns the current load as a fraction of the SLO.
+
+        Whichever of latency or queue depth is closer to its limit wins.
+        Queue depth includes `backlog`, work still owed to requests that have
+        already been answered (e.g. deferred Grad-CAM heatmaps).
+        """
+        latency_ratio = self.latency_percentile_ms() / self.slo_latency_ms
+        queue_ratio = (self.in_flight + self.backlog()) / self.max_in_flight
+        return max(latency_ratio, queue_ratio)
+
+    def should_reject(self, api_key: str) -> bool:
+        """Whether a request from the given key should be shed right now."""
+        # Re-evaluate first so the controller can recover even when only
+        # low-priority traffic (which never reaches `track`) is arriving.
+        self._update_level()
+        return (
+            self.level >= DegradationLevel.SHED_LOW_PRIORITY
+            and api_key in self.low_priority_keys
+        )
+
+    def record_latency(self, latency_ms: float):
+        """Adds a completed request's latency and re-evaluates the level."""
+        self._latencies_ms.append((self._clock(), latency_ms))
+        self._update_level()
+
+    def request_started(self) -> float:
+        """Counts a newly arrived request as in flight and returns its start time."""
+        self.in_flight += 1
+        self._update_level()
+        return self._clock()
+
+    def request_finished(self, started: float, record: bool = True):
+        """
+        Marks a request as no longer in flight.
+
+        Its latency, measured from `started`, is recorded unless `record` is
+        False (e.g. for requests rejected before doing any work).
+        """
+        self.in_flight -= 1
+        if record:
+            self.record_latency((self._clock() - started) * 1000)
+        else:
+            self._update_level()
+
+    @contextmanager
+    def track(self, record: bool = True):
+        """
+        Context manager wrapping a single request.
+
+        Counts the request as in flight while it runs and, unless `record` is
+        False, records its latency once it completes.
+        """
+        started = self.request_started()
+        try:
+            yield
+        finally:
+            self.request_finished(started, record=record)
+
+    def _update_level(self):
+        """Moves at most one level up or down, respecting the dwell time."""
+        now = self._clock()
+        if now - self._last_change < MIN_DWELL_SECONDS:
+            return
+
+        pressure = self.pressure()
+        new_level = self.level
+        if pressure > ESCALATE_THRESHOLD and self.level < DegradationLevel.SHED_LOW_PRIORITY:
+            new_level = DegradationLevel(self.level + 1)
+        elif pressure < RECOVER_THRESHOLD and self.level > DegradationLevel.NORMAL:
+            new_level = DegradationLevel(self.level - 1)
+
+        if new_level != self.level:
+            logger.warning(
+                "Degradation level changed from %s to %s (pressure: %.2f)",
+                self.level.name, new_level.name, pressure,
+            )
+            self.level = new_level
+            self._last_change = now
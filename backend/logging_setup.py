@@ -0,0 +1,250 @@
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+import copy
+import json
+import logging
+import queue
+import random
+import re
+import sys
+import threading
+import time
+
+# --- Constants ---
+LOG_QUEUE_SIZE = 10000  # Records beyond this are dropped rather than blocking the caller
+
+# The ID of the request currently being handled, attached to every log record.
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+# Attributes every LogRecord has; anything else was passed via `extra=`.
+# Uvicorn's `color_message` is a terminal-only duplicate of the message.
+_STANDARD_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {
+    "message", "asctime", "request_id", "color_message",
+}
+
+# Uvicorn's loggers write to stderr directly by default; route them through the queue too.
+UVICORN_LOGGERS = ("uvicorn", "uvicorn.error", "uvicorn.access")
+
+# Streaming clients may pass their API key in the URL, which uvicorn logs verbatim.
+_API_KEY_PARAM = re.compile(r"(api_key=)[^&\s\"']+")
+
+_queue_handler: Optional[QueueHandler] = None
+_listener: Optional[QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats log records as single-line JSON objects."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "timestamp": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+        }
+        # Include any structured fields passed via `extra=`
+        for key, value in vars(record).items():
+            if key not in _STANDARD_RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class RequestIdFilter(logging.Filter):
+    """Attaches the current request ID from `request_id_var` to each record."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class RedactApiKeyFilter(logging.Filter):
+    """Masks `api_key=...` query parameters in log messages, e.g. uvicorn's WebSocket handshake logs."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        message = record.getMessage()
+        redacted = _API_KEY_PARAM.sub(r"\1[REDACTED]", message)
+        if redacted != message:
+            record.msg, record.args = redacted, None
+            # Uvicorn keeps a second, colourised copy of the message
+            if hasattr(record, "color_message"):
+                del record.color_message
+        return True
+
+
+class RequestIdMiddleware:
+    """
+    ASGI middleware that gives every HTTP request and WebSocket connection a
+    request ID before any other code runs, so records logged during
+    authentication are tagged too. The ID is echoed in an `X-Request-ID`
+    response header.
+
+    The ID is deliberately left set once the app returns: uvicorn runs every
+    request in a task with its own context, and it logs unhandled exceptions
+    from that same task after the app has raised, so those tracebacks are
+    tagged with the request that caused them too.
+    """
+
+    def __init__(self, app, generate_id):
+        self.app = app
+        self.generate_id = generate_id
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        request_id = self.generate_id()
+        request_id_var.set(request_id)
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-request-id", request_id.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        await self.app(scope, receive, send_with_request_id)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Per-logger sampling and rate limiting.
+
+    `sample_rates` maps logger names to the fraction of records to keep.
+    `rate_limits` maps logger names to the maximum records per second, with
+    `default_rate_limit` applied to any logger not listed (0 means unlimited).
+    Warnings and errors are never sampled, only rate limited. The number of
+    records dropped by the rate limit is reported on the next record let through.
+    """
+
+    def __init__(
+        self,
+        sample_rates: Optional[Dict[str, float]] = None,
+        rate_limits: Optional[Dict[str, float]] = None,
+        default_rate_limit: float = 0.0,
+        clock=time.monotonic,
+    ):
+        super().__init__()
+        self.sample_rates = sample_rates or {}
+        self.rate_limits = rate_limits or {}
+        self.default_rate_limit = default_rate_limit
+        self._clock = clock
+        self._lock = threading.Lock()
+        # Token bucket per logger: name -> [tokens, last_refill]
+        self._buckets: Dict[str, list] = {}
+        self._suppressed: Dict[str, int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        sample_rate = self.sample_rates.get(record.name, 1.0)
+        if record.levelno < logging.WARNING and sample_rate < 1.0 and random.random() >= sample_rate:
+            return False
+
+        rate = self.rate_limits.get(record.name, self.default_rate_limit)
+        if rate <= 0:
+            return True
+
+        with self._lock:
+            now = self._clock()
+            # Allow bursts of up to one second's worth of records (at least one)
+            capacity = max(rate, 1.0)
+            tokens, last_refill = self._buckets.get(record.name, (capacity, now))
+            tokens = min(capacity, tokens + (now - last_refill) * rate)
+            if tokens < 1:
+                self._buckets[record.name] = [tokens, now]
+                self._suppressed[record.name] = self._suppressed.get(record.name, 0) + 1
+                return False
+            self._buckets[record.name] = [tokens - 1, now]
+            suppressed = self._suppressed.pop(record.name, 0)
+
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    A QueueHandler that drops records instead of blocking when the queue is full.
+
+    The number of records dropped is reported on the next record that makes it
+    onto the queue.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Unlike the base class, don't format the whole record here: only merge
+        # the message arguments, leaving JSON formatting to the listener thread.
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        with self._dropped_lock:
+            if self.dropped:
+                record.dropped = self.dropped
+            try:
+                self.queue.put_nowait(record)
+                self.dropped = 0
+            except queue.Full:
+                self.dropped += 1
+
+
+def setup_logging(
+    level: str = "INFO",
+    sample_rates: Optional[Dict[str, float]] = None,
+    rate_limits: Optional[Dict[str, float]] = None,
+    default_rate_limit: float = 0.0,
+):
+    """
+    Routes all application logging through a background thread.
+
+    Callers only pay for filtering and enqueueing the record; formatting to
+    JSON and writing to stderr happen on the listener thread, so slow log I/O
+    can't block the event loop. Safe to call more than once.
+    """
+    global _queue_handler, _listener
+    shutdown_logging()
+
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    _queue_handler = DroppingQueueHandler(log_queue)
+    _queue_handler.addFilter(RedactApiKeyFilter())
+    _queue_handler.addFilter(RequestIdFilter())
+    _queue_handler.addFilter(RateLimitFilter(sample_rates, rate_limits, default_rate_limit))
+
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(JsonFormatter())
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+
+    root = logging.getLogger()
+    root.setLevel(level.upper())
+    root.addHandler(_queue_handler)
+    for name in UVICORN_LOGGERS:
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers.clear()
+        uvicorn_logger.propagate = True
+    _listener.start()
+
+
+def shutdown_logging():
+    """Flushes any queued records and stops the background logging thread."""
+    global _queue_handler, _listener
+    if _queue_handler is not None:
+        logging.getLogger().removeHandler(_queue_handler)
+        _queue_handler = None
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
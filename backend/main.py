@@ -1,25 +1,40 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, Request
+from fastapi import (
+    FastAPI, UploadFile, File, HTTPException, Depends, Request,
+    WebSocket, WebSocketDisconnect, status
+)
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
+from limits import parse as parse_rate_limit
+from collections import Counter
 from PIL import Image
+import asyncio
 import io
 import logging
 import os
-import torch
 
 from .explainability import generate_request_id, generate_grad_cam_overlay
-from .security import get_api_key, get_api_key_for_rate_limiting
-from .ml_utils import get_model, preprocess_image
+from .security import get_api_key, get_api_key_for_rate_limiting, get_websocket_api_key
+from .ml_utils import (
+    get_model, preprocess_image, classify_tensor, run_on_model, LowPriorityModelQueue, IMAGE_SIZE
+)
+from .config import settings
+from .load_shedding import LoadShedder, DegradationLevel, REDUCED_IMAGE_SIZE
+from .streaming import FrameBatcher, StreamSession, MAX_STREAMS_PER_KEY, FRAMES_PER_RATE_LIMIT_HIT
+from .cascade import load_cascade_config
+from .logging_setup import setup_logging, shutdown_logging, request_id_var, RequestIdMiddleware
 
 # --- App Configuration ---
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
 
 # --- Rate Limiting Setup ---
 # Read Redis URL from environment variable, with a fallback for local dev without Docker
 redis_url = os.environ.get("REDIS_URL", "redis://localhost:6379")
 limiter = Limiter(key_func=get_api_key_for_rate_limiting, storage_uri=redis_url)
+CLASSIFY_RATE_LIMIT = "100/day"
+# Shared by /classify-lesion and /ws/classify-stream, so both draw on one per-key budget
+CLASSIFY_RATE_LIMIT_SCOPE = "classify"
 
 app = FastAPI(
     title="DermAssist API",
@@ -55,11 +70,71 @@ CLASS_LABELS = {
 @app.on_event("startup")
 async def startup_event():
     """Actions to perform on application startup."""
-    logging.info("Application startup...")
+    # Log through a background thread so log I/O never blocks the event loop
+    setup_logging(
+        level=settings.LOG_LEVEL,
+        sample_rates=settings.LOG_SAMPLE_RATES,
+        rate_limits=settings.LOG_RATE_LIMITS,
+        default_rate_limit=settings.LOG_DEFAULT_RATE_LIMIT,
+    )
+    logger.info("Application startup...")
     # Load the machine learning model
     app.state.model = get_model()
-    logging.info("ML model loaded.")
-    logging.info("Application ready.")
+    logger.info("ML model loaded.")
+    # Deferred Grad-CAM heatmaps, keyed by request ID. They only run while no
+    # inference is waiting, and are abandoned if load keeps climbing.
+    app.state.deferred_grad_cams = LowPriorityModelQueue(
+        should_drop=lambda: app.state.load_shedder.level > DegradationLevel.DEFER_GRAD_CAM
+    )
+    app.state.deferred_grad_cams.start()
+    # Track latency and queue depth (including deferred heatmaps) so we can degrade gracefully under load
+    app.state.load_shedder = LoadShedder.from_settings(
+        settings, backlog=app.state.deferred_grad_cams.__len__
+    )
+    # Shared across all streaming connections so their frames are batched together
+    app.state.frame_batcher = FrameBatcher(app.state.model)
+    app.state.frame_batcher.start()
+    # Number of open streaming connections per API key
+    app.state.stream_connections = Counter()
+    app.state.cascade = load_cascade_config() if settings.CASCADE_ENABLED else None
+    logger.info("Application ready.")
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Actions to perform on application shutdown."""
+    await app.state.frame_batcher.close()
+    await app.state.deferred_grad_cams.close()
+    shutdown_logging()
+
+
+@app.middleware("http")
+async def track_classification_load(request: Request, call_next):
+    """
+    Reports /classify-lesion traffic to the load shedder.
+
+    Requests count as in flight from the moment they arrive, so time spent
+    queueing for the model shows up in both queue depth and latency.
+    """
+    if request.url.path != "/classify-lesion":
+        return await call_next(request)
+
+    load_shedder = app.state.load_shedder
+    started = load_shedder.request_started()
+    response = None
+    try:
+        response = await call_next(request)
+        return response
+    finally:
+        # Rejections and errors return early and would skew latency downwards
+        load_shedder.request_finished(
+            started, record=response is not None and response.status_code == 200
+        )
+
+
+# Added last so it is the outermost middleware and every log record, including
+# those from authentication and load tracking, carries the request ID
+app.add_middleware(RequestIdMiddleware, generate_id=generate_request_id)
 
 
 @app.get("/")
@@ -75,7 +150,7 @@ def health_check():
 
 
 @app.post("/classify-lesion")
-@limiter.limit("100/day")
+@limiter.shared_limit(CLASSIFY_RATE_LIMIT, scope=CLASSIFY_RATE_LIMIT_SCOPE)
 async def classify_lesion(
     request: Request,
     file: UploadFile = File(...), 
@@ -85,49 +160,226 @@ async def classify_lesion(
     Endpoint to classify a skin lesion from an uploaded image.
     Generates a heatmap and returns classification details.
     Requires API key authentication.
+
+    Under load the endpoint degrades in stages (see `DegradationLevel`);
+    the level applied is reported in the response. With `CASCADE_ENABLED`,
+    confident low-risk cases are answered by a cheap screening pass alone.
     """
     if not file.content_type.startswith('image/'):
         raise HTTPException(status_code=400, detail="File provided is not an image.")
 
-    # Generate a unique ID for this request
-    request_id = generate_request_id()
+    load_shedder = app.state.load_shedder
+    if load_shedder.should_reject(api_key):
+        raise HTTPException(
+            status_code=503,
+            detail="Service is under heavy load. Please retry later.",
+            headers={"Retry-After": "30"},
+        )
+
+    level = load_shedder.level
+
+    # Assigned by RequestIdMiddleware, which also tags this request's log records
+    request_id = request_id_var.get()
 
     # Read and preprocess the image
     contents = await file.read()
     image = Image.open(io.BytesIO(contents))
-    image_tensor = preprocess_image(contents)
+
+    # Cascade first stage: a cheap screening pass that can answer on its own
+    cascade = app.state.cascade
+    if cascade is not None:
+        screening_tensor = await asyncio.to_thread(
+            preprocess_image, contents, image_size=cascade.image_size
+        )
+        class_idx, confidence_score = await run_on_model(
+            classify_tensor, app.state.model, screening_tensor
+        )
+        if not cascade.should_escalate(class_idx, confidence_score):
+            predicted_label = CLASS_LABELS[class_idx]
+            logger.info(
+                "Classified lesion",
+                extra={"stage": "screening", "degradation_level": level.name.lower()},
+            )
+            return {
+                "label": predicted_label,
+                "confidence": round(confidence_score, 4),
+                "recommendation": f"Consultation recommended for '{predicted_label}'.", # Placeholder
+                "request_id": request_id,
+                "degradation_level": level.name.lower(),
+                "cascade_stage": "screening",
+                "heatmap_status": "unavailable"
+            }
+
+    image_size = REDUCED_IMAGE_SIZE if level >= DegradationLevel.REDUCED_RESOLUTION else IMAGE_SIZE
+    image_tensor = await asyncio.to_thread(preprocess_image, contents, image_size=image_size)
     
     # Run inference
-    with torch.no_grad():
-        outputs = app.state.model(image_tensor)
-        probabilities = torch.nn.functional.softmax(outputs, dim=1)
-        confidence, predicted_class_idx = torch.max(probabilities, 1)
-
-    predicted_label = CLASS_LABELS[predicted_class_idx.item()]
-    confidence_score = confidence.item()
-
-    # Generate Grad-CAM heatmap
-    generate_grad_cam_overlay(
-        model=app.state.model, 
-        image=image, 
-        image_tensor=image_tensor, 
-        pred_class_idx=predicted_class_idx.item(),
-        request_id=request_id
+    class_idx, confidence_score = await run_on_model(classify_tensor, app.state.model, image_tensor)
+    predicted_label = CLASS_LABELS[class_idx]
+
+    # Generate Grad-CAM heatmap. Under load it is deferred until the model is
+    # idle, and under heavy load it is skipped entirely.
+    grad_cam_kwargs = {
+        "model": app.state.model,
+        "image": image,
+        "image_tensor": image_tensor,
+        "pred_class_idx": class_idx,
+        "request_id": request_id,
+    }
+    if level == DegradationLevel.NORMAL:
+        await run_on_model(generate_grad_cam_overlay, **grad_cam_kwargs)
+        heatmap_status = "ready"
+    elif level == DegradationLevel.DEFER_GRAD_CAM:
+        app.state.deferred_grad_cams.submit(request_id, generate_grad_cam_overlay, **grad_cam_kwargs)
+        heatmap_status = "pending"
+    else:
+        heatmap_status = "unavailable"
+    logger.info(
+        "Classified lesion",
+        extra={"stage": "full", "degradation_level": level.name.lower()},
     )
     
     return {
         "label": predicted_label,
         "confidence": round(confidence_score, 4),
         "recommendation": f"Consultation recommended for '{predicted_label}'.", # Placeholder
-        "request_id": request_id
+        "request_id": request_id,
+        "degradation_level": level.name.lower(),
+        "cascade_stage": "full",
+        "heatmap_status": heatmap_status
     }
 
 
+@app.websocket("/ws/classify-stream")
+async def classify_stream(websocket: WebSocket):
+    """
+    Streams live classifications for continuous dermatoscope video frames.
+
+    The client authenticates once when connecting (`X-API-Key` header or
+    `api_key` query parameter), chooses an update rate and whether it wants a
+    low-resolution CAM (`?rate=5&cam=true`), then sends JPEG frames as binary
+    messages. Only the latest frame is classified; frames that arrive while
+    inference is busy are dropped. Results are pushed back as JSON.
+    """
+    api_key = get_websocket_api_key(websocket)
+    if api_key is None:
+        logger.warning("Rejected streaming connection with an invalid API key.")
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    if app.state.load_shedder.should_reject(api_key):
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+        return
+    if app.state.stream_connections[api_key] >= MAX_STREAMS_PER_KEY:
+        logger.warning("Rejected streaming connection: too many open streams for this key.")
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER, reason="Too many open streams.")
+        return
+    # Opening a stream costs one classification against the key's rate limit
+    if not charge_stream_rate_limit(api_key):
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Rate limit exceeded.")
+        return
+
+    # Counted before the first await so concurrent connects can't both slip under the cap
+    app.state.stream_connections[api_key] += 1
+    session = StreamSession.from_query_params(websocket.query_params)
+
+    async def receive_frames():
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            if message.get("bytes"):
+                session.push_frame(message["bytes"])
+
+    async def send_updates():
+        loop = asyncio.get_running_loop()
+        load_shedder = app.state.load_shedder
+        frames_classified = 0
+        while True:
+            frame = await session.next_frame()
+            started = loop.time()
+            try:
+                image_tensor = await asyncio.to_thread(preprocess_image, frame)
+            except Exception:
+                await websocket.send_json({"type": "error", "detail": "Frame is not a valid image."})
+                continue
+
+            # The CAM is the first thing to go when the service is under load
+            with_cam = session.with_cam and load_shedder.level == DegradationLevel.NORMAL
+            # Frames add to the queue depth, but their batched model-only latency
+            # isn't comparable with the /classify-lesion SLO, so it isn't recorded
+            try:
+                with load_shedder.track(record=False):
+                    result = await app.state.frame_batcher.classify(image_tensor, with_cam=with_cam)
+            except Exception as e:
+                logger.error("Stream inference failed: %s", e)
+                await websocket.send_json({"type": "error", "detail": "Inference failed."})
+                continue
+
+            # Long-lived streams keep paying into the rate limit, without a
+            # Redis round trip for every frame
+            frames_classified += 1
+            if frames_classified % FRAMES_PER_RATE_LIMIT_HIT == 0 and not charge_stream_rate_limit(api_key):
+                await websocket.send_json({"type": "error", "detail": "Rate limit exceeded."})
+                await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+                return
+
+            update = {
+                "type": "prediction",
+                "label": CLASS_LABELS[result.class_idx],
+                "confidence": round(result.confidence, 4),
+                "frames_received": session.frames_received,
+                "frames_dropped": session.frames_dropped,
+            }
+            if result.cam is not None:
+                update["cam"] = result.cam
+            await websocket.send_json(update)
+
+            # Pace updates at the rate the client negotiated
+            await asyncio.sleep(max(0.0, 1 / session.update_rate - (loop.time() - started)))
+
+    tasks = []
+    try:
+        await websocket.accept()
+        await websocket.send_json({"type": "config", **session.options()})
+        tasks = [asyncio.create_task(receive_frames()), asyncio.create_task(send_updates())]
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            task.result()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        for task in tasks:
+            task.cancel()
+        app.state.stream_connections[api_key] -= 1
+        if not app.state.stream_connections[api_key]:
+            del app.state.stream_connections[api_key]
+
+
+def charge_stream_rate_limit(api_key: str) -> bool:
+    """
+    Counts one classification against the key's rate limit, in the same
+    bucket slowapi uses for /classify-lesion.
+
+    Returns False if the limit has been reached.
+    """
+    return limiter.limiter.hit(
+        parse_rate_limit(CLASSIFY_RATE_LIMIT), api_key, CLASSIFY_RATE_LIMIT_SCOPE
+    )
+
+
 @app.get("/heatmap/{request_id}")
 def get_heatmap(request_id: str):
     """
     Retrieves the Grad-CAM heatmap overlay image for a given request ID.
+    Returns 202 while a deferred heatmap is still being generated.
     """
+    if request_id in app.state.deferred_grad_cams:
+        return JSONResponse(
+            status_code=202,
+            content={"detail": "Heatmap is still being generated."},
+            headers={"Retry-After": "1"},
+        )
+
     heatmap_path = os.path.join("heatmaps", f"{request_id}.png")
     if not os.path.exists(heatmap_path):
         raise HTTPException(status_code=404, detail="Heatmap not found for the given request ID.")
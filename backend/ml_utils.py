@@ -1,18 +1,36 @@
 import torch
 from torchvision import transforms, models
 from PIL import Image
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+import asyncio
+import contextvars
+import functools
 import io
 import logging
 
+logger = logging.getLogger(__name__)
+
 # --- Constants ---
 MODEL_PATH = "models/dermassist_mobilenet_v2.pt"
 NUM_CLASSES = 7  # From the HAM10000 dataset
 IMAGE_SIZE = 224
 
+# A single worker runs every piece of work that touches the shared model.
+# This keeps inference off the event loop (so queued requests are actually
+# seen as in flight) and serialises model access: torchcam's GradCAM hooks on
+# `model.features` would otherwise capture other requests' activations.
+_model_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="model")
+
+# Calls submitted through `run_on_model` that haven't finished yet
+_queued_model_calls = 0
+LOW_PRIORITY_POLL_SECONDS = 0.01  # How often low-priority work checks whether the model is free
+
 # --- Model Loading ---
 def get_model():
     """Loads the pretrained MobileNetV2 model and adapts it for our classification task."""
-    logging.info("Initializing MobileNetV2 model...")
+    logger.info("Initializing MobileNetV2 model...")
     model = models.mobilenet_v2() # We don't need pretrained weights, just the architecture
     
     # Adapt the classifier to our number of classes
@@ -23,7 +41,7 @@ def get_model():
         torch.nn.Linear(256, NUM_CLASSES)
     )
     
-    logging.info(f"Loading model weights from {MODEL_PATH}")
+    logger.info("Loading model weights from %s", MODEL_PATH)
     # Load the state dictionary. We map to CPU for broader compatibility, 
     # but it will run on CUDA if available.
     model.load_state_dict(torch.load(MODEL_PATH, map_location=torch.device('cpu')))
@@ -31,13 +49,114 @@ def get_model():
     return model
 
 # --- Image Preprocessing ---
-def preprocess_image(image_bytes: bytes) -> torch.Tensor:
-    """Takes image bytes, preprocesses it, and returns a tensor."""
-    transform = transforms.Compose([
-        transforms.Resize(256),
-        transforms.CenterCrop(IMAGE_SIZE),
+def build_transform(image_size: int = IMAGE_SIZE) -> transforms.Compose:
+    """
+    Returns the inference transform for a given input resolution.
+
+    A smaller `image_size` trades some accuracy for a cheaper forward pass;
+    MobileNetV2 pools globally, so it accepts any input resolution. The
+    resize keeps the same crop ratio as the full-resolution transform.
+    """
+    return transforms.Compose([
+        transforms.Resize(int(image_size * 256 / IMAGE_SIZE)),
+        transforms.CenterCrop(image_size),
         transforms.ToTensor(),
         transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
     ])
+
+
+def preprocess_image(image_bytes: bytes, image_size: int = IMAGE_SIZE) -> torch.Tensor:
+    """Takes image bytes, preprocesses it, and returns a tensor."""
     image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-    return transform(image).unsqueeze(0) 
\ No newline at end of file
+    return build_transform(image_size)(image).unsqueeze(0) 
+
+
+# --- Inference ---
+def classify_tensor(model: torch.nn.Module, image_tensor: torch.Tensor):
+    """Runs the model on a preprocessed image and returns (class_idx, confidence)."""
+    with torch.no_grad():
+        outputs = model(image_tensor)
+        probabilities = torch.nn.functional.softmax(outputs, dim=1)
+        confidence, predicted_class_idx = torch.max(probabilities, 1)
+    return predicted_class_idx.item(), confidence.item()
+
+
+async def run_on_model(func, *args, **kwargs):
+    """
+    Runs `func` on the dedicated model thread and waits for the result.
+
+    Anything using the shared model must go through here. The caller's
+    context is carried over so log records keep their request ID.
+    """
+    global _queued_model_calls
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    _queued_model_calls += 1
+    try:
+        return await loop.run_in_executor(
+            _model_executor, functools.partial(context.run, func, *args, **kwargs)
+        )
+    finally:
+        _queued_model_calls -= 1
+
+
+class LowPriorityModelQueue:
+    """
+    Model work that can wait, such as deferred Grad-CAM heatmaps.
+
+    Items are run one at a time on the model thread, and only while no
+    `run_on_model` call is waiting, so they never hold up inference. While
+    `should_drop` returns True, anything still queued is discarded instead.
+    Each item is identified by a key, e.g. the request ID.
+    """
+
+    def __init__(self, should_drop: Callable[[], bool] = lambda: False):
+        self.should_drop = should_drop
+        self._pending = OrderedDict()  # key -> call, oldest first
+        self._running: Optional[str] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._pending) + (self._running is not None)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._pending or key == self._running
+
+    def submit(self, key: str, func, *args, **kwargs):
+        """Queues `func` to run on the model thread once it is otherwise idle."""
+        context = contextvars.copy_context()
+        self._pending[key] = functools.partial(context.run, func, *args, **kwargs)
+
+    def start(self):
+        """Starts the worker task on the running loop."""
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run(), context=contextvars.Context())
+
+    async def close(self):
+        """Stops the worker task, discarding any queued work."""
+        self._pending.clear()
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            if self._pending and self.should_drop():
+                logger.warning("Dropping %d queued low-priority model tasks", len(self._pending))
+                self._pending.clear()
+            if not self._pending or _queued_model_calls:
+                await asyncio.sleep(LOW_PRIORITY_POLL_SECONDS)
+                continue
+
+            self._running, call = self._pending.popitem(last=False)
+            try:
+                await loop.run_in_executor(_model_executor, call)
+            except Exception as e:
+                logger.error("Low-priority model task failed: %s", e)
+            finally:
+                self._running = None
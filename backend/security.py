@@ -1,9 +1,13 @@
-from fastapi import Security, HTTPException, status, Request
+from fastapi import Security, HTTPException, status, Request, WebSocket
 from fastapi.security import APIKeyHeader
+from typing import Optional
+import hashlib
 import logging
 
 from .config import settings
 
+logger = logging.getLogger(__name__)
+
 # --- API Key Authentication ---
 API_KEY_NAME = "X-API-Key"
 api_key_header = APIKeyHeader(name=API_KEY_NAME, auto_error=True)
@@ -27,8 +31,25 @@ async def get_api_key(api_key: str = Security(api_key_header)):
     if api_key in settings.API_KEYS:
         return api_key
     else:
-        logging.warning(f"Invalid API Key received: {api_key}")
+        # Never log the key itself; a short fingerprint is enough to spot repeats
+        logger.warning(
+            "Invalid API Key received (fingerprint: %s)",
+            hashlib.sha256(api_key.encode()).hexdigest()[:8],
+        )
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid API Key",
-        ) 
\ No newline at end of file
+        )
+
+
+def get_websocket_api_key(websocket: WebSocket) -> Optional[str]:
+    """
+    Returns the API key for a WebSocket connection if it is valid, else None.
+
+    Browsers can't set custom headers on WebSocket connections, so the key
+    may also be passed as an `api_key` query parameter.
+    """
+    api_key = websocket.headers.get(API_KEY_NAME) or websocket.query_params.get("api_key")
+    if api_key in settings.API_KEYS:
+        return api_key
+    return None
@@ -0,0 +1,185 @@
+from dataclasses import dataclass, field
+from typing import List, Optional
+import asyncio
+import contextvars
+import logging
+import math
+
+import torch
+
+from .explainability import batch_grad_cam
+from .ml_utils import run_on_model
+
+logger = logging.getLogger(__name__)
+
+# --- Constants ---
+MAX_BATCH_SIZE = 16          # Upper bound on frames in a single forward pass
+BATCH_WAIT_SECONDS = 0.01    # How long to wait for more frames before running a batch
+DEFAULT_UPDATE_RATE = 5.0    # Updates per second if the client doesn't ask for a rate
+MAX_UPDATE_RATE = 15.0       # Clients can't ask for more updates than this
+MAX_STREAMS_PER_KEY = 2      # Concurrent streaming connections allowed per API key
+FRAMES_PER_RATE_LIMIT_HIT = 300  # Frames classified per extra rate-limit hit on a stream
+
+
+@dataclass
+class FrameResult:
+    """The outcome of classifying a single streamed frame."""
+    class_idx: int
+    confidence: float
+    cam: Optional[List[List[float]]] = None
+
+
+@dataclass
+class _PendingFrame:
+    image_tensor: torch.Tensor
+    with_cam: bool
+    future: asyncio.Future = field(repr=False)
+
+
+class FrameBatcher:
+    """
+    Collects frames from all open streaming connections and classifies them
+    together, so concurrent streams share forward passes instead of each
+    paying for its own.
+
+    Inference runs on the shared model thread (see `run_on_model`), so it
+    doesn't block the event loop or race HTTP requests using the same model.
+    """
+
+    def __init__(
+        self,
+        model: torch.nn.Module,
+        max_batch_size: int = MAX_BATCH_SIZE,
+        batch_wait_seconds: float = BATCH_WAIT_SECONDS,
+    ):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.batch_wait_seconds = batch_wait_seconds
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    async def classify(self, image_tensor: torch.Tensor, with_cam: bool = False) -> FrameResult:
+        """Queues a preprocessed (1, C, H, W) frame and waits for its result."""
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(_PendingFrame(image_tensor, with_cam, future))
+        return await future
+
+    async def close(self):
+        """Stops the worker task, if it is running."""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+    def start(self):
+        """
+        Starts the worker task on the running loop.
+
+        The worker serves every connection, so it runs in an empty context
+        rather than inheriting the request ID of whoever started it.
+        """
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run(), context=contextvars.Context())
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + self.batch_wait_seconds
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                results = await run_on_model(self._infer, batch)
+            except Exception as e:
+                # Each caller logs the failure from its own task, with its own request ID
+                for pending in batch:
+                    if not pending.future.done():
+                        pending.future.set_exception(e)
+                continue
+
+            for pending, result in zip(batch, results):
+                if not pending.future.done():
+                    pending.future.set_result(result)
+
+    def _infer(self, batch: List[_PendingFrame]) -> List[FrameResult]:
+        """Runs a single forward pass over every frame in the batch."""
+        image_tensor = torch.cat([pending.image_tensor for pending in batch])
+        with_cam = any(pending.with_cam for pending in batch)
+        probabilities, cams = batch_grad_cam(self.model, image_tensor, with_cam=with_cam)
+        confidences, class_idxs = torch.max(probabilities, 1)
+
+        results = []
+        for i, pending in enumerate(batch):
+            cam = None
+            if pending.with_cam:
+                cam = [[round(v, 3) for v in row] for row in cams[i].tolist()]
+            results.append(FrameResult(
+                class_idx=class_idxs[i].item(),
+                confidence=confidences[i].item(),
+                cam=cam,
+            ))
+        return results
+
+
+class StreamSession:
+    """
+    Per-connection state for a streaming client.
+
+    Only the most recent frame is kept: if a new frame arrives before the
+    previous one was picked up for inference, the old one is dropped, so a
+    slow model never builds up a backlog of stale frames.
+    """
+
+    def __init__(self, update_rate: float = DEFAULT_UPDATE_RATE, with_cam: bool = False):
+        self.update_rate = min(max(update_rate, 0.1), MAX_UPDATE_RATE)
+        self.with_cam = with_cam
+        self.frames_received = 0
+        self.frames_dropped = 0
+        self._latest: Optional[bytes] = None
+        self._new_frame = asyncio.Event()
+
+    @classmethod
+    def from_query_params(cls, query_params) -> "StreamSession":
+        """
+        Builds a session from the options the client asked for in the
+        connection URL, e.g. `?rate=2&cam=true`.
+        """
+        try:
+            update_rate = float(query_params.get("rate", DEFAULT_UPDATE_RATE))
+        except ValueError:
+            update_rate = DEFAULT_UPDATE_RATE
+        if not math.isfinite(update_rate):
+            update_rate = DEFAULT_UPDATE_RATE
+        with_cam = query_params.get("cam", "false").lower() in ("1", "true", "yes")
+        return cls(update_rate=update_rate, with_cam=with_cam)
+
+    def options(self) -> dict:
+        """The options actually granted to the client."""
+        return {"rate": self.update_rate, "cam": self.with_cam}
+
+    def push_frame(self, frame: bytes):
+        """Stores a newly received frame, replacing any unprocessed one."""
+        if self._latest is not None:
+            self.frames_dropped += 1
+        self._latest = frame
+        self.frames_received += 1
+        self._new_frame.set()
+
+    async def next_frame(self) -> bytes:
+        """Waits for and takes the most recent unprocessed frame."""
+        await self._new_frame.wait()
+        self._new_frame.clear()
+        frame, self._latest = self._latest, None
+        return frame
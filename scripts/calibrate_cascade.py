@@ -0,0 +1,270 @@
+import os
+import sys
+import time
+import torch
+from torch.utils.data import DataLoader
+import logging
+
+from train import (
+    SkinLesionDataset,
+    get_model,
+    PROCESSED_DATA_DIR,
+    RAW_DATA_DIR,
+    MODEL_DIR,
+    MODEL_SAVE_PATH,
+    BATCH_SIZE,
+    IMAGE_SIZE,
+)
+
+# The backend owns the cascade settings and preprocessing, so take them from there
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backend.cascade import (  # noqa: E402
+    CascadeConfig,
+    save_cascade_config,
+    CASCADE_THRESHOLDS_PATH,
+    HIGH_RISK_CLASSES,
+    SCREENING_IMAGE_SIZE,
+)
+from backend.ml_utils import build_transform  # noqa: E402
+
+# --- Configuration ---
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# --- Constants ---
+REPORT_SAVE_PATH = os.path.join(MODEL_DIR, "cascade_report.md")
+CLASS_NAMES = ['akiec', 'bcc', 'bkl', 'df', 'mel', 'nv', 'vasc']  # LabelEncoder order
+
+# --- Calibration Targets ---
+# The largest drop in sensitivity (recall) we accept for a high-risk class,
+# compared to always running the full model.
+MAX_HIGH_RISK_SENSITIVITY_DROP = 0.01
+CANDIDATE_THRESHOLDS = [round(0.5 + 0.01 * i, 2) for i in range(50)]  # 0.50 ... 0.99
+ESCALATE_ALL_THRESHOLD = 1.01
+# The threshold is chosen on one part of the validation split and the report
+# is computed on the rest, so the reported figures are out-of-sample.
+HOLDOUT_FRACTION = 0.5
+SPLIT_SEED = 42
+
+
+class TwoStageTransform:
+    """Produces both the screening and the full-resolution input for an image."""
+    def __init__(self):
+        self.screening = build_transform(SCREENING_IMAGE_SIZE)
+        self.full = build_transform(IMAGE_SIZE)
+
+    def __call__(self, image):
+        return self.screening(image), self.full(image)
+
+
+# --- Data Collection ---
+def collect_predictions(model, val_loader, device):
+    """
+    Runs both cascade stages over the validation split.
+
+    Returns the labels, each stage's softmax outputs, and the total time spent
+    in each stage's forward passes.
+    """
+    labels, screening_probs, full_probs = [], [], []
+    screening_time, full_time = 0.0, 0.0
+
+    with torch.no_grad():
+        for (screening_inputs, full_inputs), batch_labels in val_loader:
+            screening_inputs, full_inputs = screening_inputs.to(device), full_inputs.to(device)
+
+            start = time.perf_counter()
+            screening_probs.append(torch.softmax(model(screening_inputs), dim=1).cpu())
+            screening_time += time.perf_counter() - start
+
+            start = time.perf_counter()
+            full_probs.append(torch.softmax(model(full_inputs), dim=1).cpu())
+            full_time += time.perf_counter() - start
+
+            labels.append(batch_labels)
+
+    return torch.cat(labels), torch.cat(screening_probs), torch.cat(full_probs), screening_time, full_time
+
+
+def split_holdout(labels, fraction=HOLDOUT_FRACTION, seed=SPLIT_SEED):
+    """
+    Splits image indices into a calibration set and a held-out report set,
+    stratified by class so rare high-risk classes appear in both.
+    """
+    generator = torch.Generator().manual_seed(seed)
+    calibration, holdout = [], []
+    for class_idx in range(len(CLASS_NAMES)):
+        indices = torch.nonzero(labels == class_idx).flatten()
+        indices = indices[torch.randperm(len(indices), generator=generator)]
+        num_holdout = int(len(indices) * fraction)
+        holdout.append(indices[:num_holdout])
+        calibration.append(indices[num_holdout:])
+    return torch.cat(calibration), torch.cat(holdout)
+
+
+# --- Evaluation ---
+def per_class_sensitivity(preds, labels):
+    """Returns the recall of each class, or None for classes absent from the split."""
+    sensitivities = []
+    for class_idx in range(len(CLASS_NAMES)):
+        mask = labels == class_idx
+        if mask.sum() == 0:
+            sensitivities.append(None)
+        else:
+            sensitivities.append((preds[mask] == class_idx).float().mean().item())
+    return sensitivities
+
+
+def evaluate_threshold(threshold, labels, screening_probs, full_probs):
+    """Simulates the cascade at a given confidence threshold."""
+    screening_conf, screening_preds = torch.max(screening_probs, 1)
+    _, full_preds = torch.max(full_probs, 1)
+
+    high_risk = torch.isin(screening_preds, torch.tensor(sorted(HIGH_RISK_CLASSES)))
+    escalate = high_risk | (screening_conf < threshold)
+    cascade_preds = torch.where(escalate, full_preds, screening_preds)
+
+    return {
+        "threshold": threshold,
+        "escalation_rate": escalate.float().mean().item(),
+        "accuracy": (cascade_preds == labels).float().mean().item(),
+        "sensitivity": per_class_sensitivity(cascade_preds, labels),
+    }
+
+
+def select_threshold(results, full_sensitivity):
+    """
+    Picks the threshold that escalates the fewest images while keeping every
+    high-risk class within the allowed sensitivity drop.
+    """
+    def within_budget(result):
+        for class_idx in HIGH_RISK_CLASSES:
+            if full_sensitivity[class_idx] is None:
+                continue
+            drop = full_sensitivity[class_idx] - result["sensitivity"][class_idx]
+            if drop > MAX_HIGH_RISK_SENSITIVITY_DROP:
+                return False
+        return True
+
+    acceptable = [result for result in results if within_budget(result)]
+    if not acceptable:
+        return None
+    return min(acceptable, key=lambda result: result["escalation_rate"])
+
+
+def format_report(
+    result, full_accuracy, full_sensitivity, screening_ms, full_ms, num_calibration, num_holdout
+):
+    """
+    Builds a Markdown report of compute saved and per-class sensitivity change.
+
+    `result`, `full_accuracy` and `full_sensitivity` must come from the
+    held-out images, not the ones the threshold was chosen on.
+    """
+    cascade_ms = screening_ms + result["escalation_rate"] * full_ms
+
+    lines = [
+        "# Cascade Calibration Report",
+        "",
+        f"The threshold was chosen on {num_calibration} validation images. All figures "
+        f"below are measured on the other {num_holdout}, which calibration never saw.",
+        "",
+        f"- Confidence threshold: {result['threshold']:.2f}",
+        f"- High-risk classes (always escalated): {', '.join(CLASS_NAMES[i] for i in sorted(HIGH_RISK_CLASSES))}",
+        f"- Escalation rate: {result['escalation_rate']:.1%}",
+        f"- Grad-CAM passes avoided: {1 - result['escalation_rate']:.1%}",
+        "",
+        "## Compute (model forward passes only)",
+        "",
+        f"- Full model only: {full_ms:.2f} ms/image",
+        f"- Screening stage: {screening_ms:.2f} ms/image",
+        f"- Cascade (expected): {cascade_ms:.2f} ms/image",
+        f"- Compute saved: {1 - cascade_ms / full_ms:.1%}",
+        "",
+        "## Accuracy",
+        "",
+        f"- Full model only: {full_accuracy:.4f}",
+        f"- Cascade: {result['accuracy']:.4f}",
+        "",
+        "## Sensitivity per class",
+        "",
+        "| Class | Full model | Cascade | Change |",
+        "|-------|-----------:|--------:|-------:|",
+    ]
+    for class_idx, name in enumerate(CLASS_NAMES):
+        full, cascade = full_sensitivity[class_idx], result["sensitivity"][class_idx]
+        if full is None:
+            lines.append(f"| {name} | n/a | n/a | n/a |")
+        else:
+            lines.append(f"| {name} | {full:.4f} | {cascade:.4f} | {cascade - full:+.4f} |")
+    return "\n".join(lines) + "\n"
+
+
+def main():
+    """
+    Calibrates the cascade thresholds on part of the validation split and
+    reports their effect on the held-out remainder.
+    """
+    device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+
+    logging.info("Loading validation dataset...")
+    val_dataset = SkinLesionDataset(
+        csv_file=os.path.join(PROCESSED_DATA_DIR, "val.csv"),
+        root_dir=RAW_DATA_DIR,
+        transform=TwoStageTransform()
+    )
+    val_loader = DataLoader(val_dataset, batch_size=BATCH_SIZE, shuffle=False, num_workers=4)
+
+    logging.info(f"Loading model weights from {MODEL_SAVE_PATH}")
+    model = get_model(num_classes=len(CLASS_NAMES), pretrained=False)
+    model.load_state_dict(torch.load(MODEL_SAVE_PATH, map_location=device))
+    model.to(device)
+    model.eval()
+
+    logging.info("Running both cascade stages over the validation split...")
+    labels, screening_probs, full_probs, screening_time, full_time = collect_predictions(
+        model, val_loader, device
+    )
+
+    calibration, holdout = split_holdout(labels)
+
+    # Choose the threshold on the calibration images only
+    calibration_data = labels[calibration], screening_probs[calibration], full_probs[calibration]
+    _, full_preds = torch.max(full_probs[calibration], 1)
+    full_sensitivity = per_class_sensitivity(full_preds, labels[calibration])
+    results = [
+        evaluate_threshold(threshold, *calibration_data)
+        for threshold in CANDIDATE_THRESHOLDS
+    ]
+    chosen = select_threshold(results, full_sensitivity)
+    if chosen is None:
+        # A threshold above any softmax confidence escalates every image,
+        # which is always within budget.
+        logging.warning("No threshold met the sensitivity budget; escalating every image.")
+        threshold = ESCALATE_ALL_THRESHOLD
+    else:
+        threshold = chosen["threshold"]
+
+    save_cascade_config(CascadeConfig(confidence_threshold=threshold), CASCADE_THRESHOLDS_PATH)
+    logging.info(f"Cascade thresholds saved to {CASCADE_THRESHOLDS_PATH}")
+
+    # ...and report how it does on the held-out images
+    _, holdout_full_preds = torch.max(full_probs[holdout], 1)
+    holdout_result = evaluate_threshold(
+        threshold, labels[holdout], screening_probs[holdout], full_probs[holdout]
+    )
+    report = format_report(
+        holdout_result,
+        full_accuracy=(holdout_full_preds == labels[holdout]).float().mean().item(),
+        full_sensitivity=per_class_sensitivity(holdout_full_preds, labels[holdout]),
+        # Timing doesn't depend on the threshold, so average it over every image
+        screening_ms=1000 * screening_time / len(labels),
+        full_ms=1000 * full_time / len(labels),
+        num_calibration=len(calibration),
+        num_holdout=len(holdout),
+    )
+    with open(REPORT_SAVE_PATH, "w") as f:
+        f.write(report)
+    logging.info(f"Calibration report saved to {REPORT_SAVE_PATH}\n{report}")
+
+
+if __name__ == "__main__":
+    main()
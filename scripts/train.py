@@ -97,10 +97,16 @@ def get_dataloaders():
     return train_loader, val_loader
 
 # --- Model Definition ---
-def get_model(num_classes=7):
-    """Initializes a pretrained MobileNetV2 model and adapts it for our classification task."""
+def get_model(num_classes=7, pretrained=True):
+    """
+    Initializes a MobileNetV2 model and adapts it for our classification task.
+
+    Set `pretrained=False` to skip downloading the ImageNet weights, e.g. when
+    a fine-tuned state dict is about to be loaded on top.
+    """
     logging.info("Initializing MobileNetV2 model...")
-    model = models.mobilenet_v2(weights=models.MobileNet_V2_Weights.IMAGENET1K_V1)
+    weights = models.MobileNet_V2_Weights.IMAGENET1K_V1 if pretrained else None
+    model = models.mobilenet_v2(weights=weights)
     
     # Freeze all the parameters in the pre-trained model
     for param in model.parameters():
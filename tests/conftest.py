@@ -0,0 +1,26 @@
+import pytest
+
+from backend.config import settings
+
+
+class FakeClock:
+    """A manually advanced clock so tests don't depend on wall time."""
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def valid_api_key():
+    """An API key the app accepts, falling back to a placeholder if none is configured."""
+    try:
+        return list(settings.API_KEYS)[0] if settings.API_KEYS else "default-key-for-testing"
+    except Exception:
+        return "default-key-for-testing"
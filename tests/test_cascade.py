@@ -0,0 +1,63 @@
+import json
+
+from fastapi.testclient import TestClient
+
+from backend.main import app
+from backend.cascade import (
+    CascadeConfig, load_cascade_config, save_cascade_config, DEFAULT_CONFIDENCE_THRESHOLD,
+    HIGH_RISK_CLASSES, SCREENING_IMAGE_SIZE,
+)
+
+
+def test_should_escalate():
+    """
+    Tests that high-risk or low-confidence screening results escalate.
+    """
+    cascade = CascadeConfig(confidence_threshold=0.8, high_risk_classes={4})
+    assert not cascade.should_escalate(class_idx=5, confidence=0.95)
+    assert cascade.should_escalate(class_idx=5, confidence=0.5)
+    assert cascade.should_escalate(class_idx=4, confidence=0.99)
+
+
+def test_load_cascade_config(tmp_path):
+    """
+    Tests loading calibrated thresholds, and the fallback when none exist.
+    """
+    assert load_cascade_config(str(tmp_path / "missing.json")).confidence_threshold == DEFAULT_CONFIDENCE_THRESHOLD
+
+    path = tmp_path / "cascade_thresholds.json"
+    path.write_text(json.dumps({"confidence_threshold": 0.75, "high_risk_classes": [4], "image_size": 112}))
+    cascade = load_cascade_config(str(path))
+    assert cascade.confidence_threshold == 0.75
+    assert cascade.high_risk_classes == {4}
+    assert cascade.image_size == 112
+
+
+def test_save_cascade_config_round_trips(tmp_path):
+    """
+    Tests that thresholds written by the calibration script load back unchanged.
+    """
+    path = str(tmp_path / "cascade_thresholds.json")
+    save_cascade_config(CascadeConfig(confidence_threshold=0.82), path)
+    cascade = load_cascade_config(path)
+    assert cascade.confidence_threshold == 0.82
+    assert cascade.high_risk_classes == HIGH_RISK_CLASSES
+    assert cascade.image_size == SCREENING_IMAGE_SIZE
+
+
+def test_classify_lesion_screening_stage(valid_api_key):
+    """
+    Tests that a confident screening result is returned without escalating.
+    """
+    with TestClient(app) as client:
+        app.state.cascade = CascadeConfig(confidence_threshold=0.0, high_risk_classes=set())
+        with open("sample_lesion.jpg", "rb") as f:
+            response = client.post(
+                "/classify-lesion",
+                headers={"X-API-Key": valid_api_key},
+                files={"file": ("sample_lesion.jpg", f, "image/jpeg")},
+            )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["cascade_stage"] == "screening"
+        assert data["heatmap_status"] == "unavailable"
@@ -0,0 +1,206 @@
+import asyncio
+import threading
+
+import httpx
+from fastapi.testclient import TestClient
+
+from backend.main import app, limiter
+from backend.load_shedding import LoadShedder, DegradationLevel, MIN_DWELL_SECONDS
+from backend.ml_utils import LowPriorityModelQueue, run_on_model
+
+
+def make_shedder(clock, low_priority_keys=None, backlog=lambda: 0):
+    return LoadShedder(
+        slo_latency_ms=100.0,
+        max_in_flight=4,
+        low_priority_keys=low_priority_keys,
+        backlog=backlog,
+        clock=clock,
+    )
+
+
+def test_escalates_one_level_at_a_time_with_dwell(clock):
+    """
+    Sustained SLO violations should degrade the service one stage at a time,
+    waiting at least the dwell time between stages.
+    """
+    shedder = make_shedder(clock)
+
+    shedder.record_latency(500.0)
+    assert shedder.level == DegradationLevel.DEFER_GRAD_CAM
+
+    # Still overloaded, but within the dwell time: no change.
+    shedder.record_latency(500.0)
+    assert shedder.level == DegradationLevel.DEFER_GRAD_CAM
+
+    for expected in (DegradationLevel.REDUCED_RESOLUTION, DegradationLevel.SHED_LOW_PRIORITY):
+        clock.now += MIN_DWELL_SECONDS
+        shedder.record_latency(500.0)
+        assert shedder.level == expected
+
+    # The last stage is the ceiling.
+    clock.now += MIN_DWELL_SECONDS
+    shedder.record_latency(500.0)
+    assert shedder.level == DegradationLevel.SHED_LOW_PRIORITY
+
+
+def test_recovers_with_hysteresis(clock):
+    """
+    Load just under the SLO must not trigger recovery; it should only happen
+    once pressure falls below the lower recovery threshold.
+    """
+    shedder = make_shedder(clock)
+    shedder.record_latency(500.0)
+    assert shedder.level == DegradationLevel.DEFER_GRAD_CAM
+
+    # Old slow samples age out, leaving latency at 90% of the SLO.
+    clock.now += 120
+    for _ in range(10):
+        shedder.record_latency(90.0)
+    assert shedder.level == DegradationLevel.DEFER_GRAD_CAM
+
+    clock.now += MIN_DWELL_SECONDS
+    for _ in range(50):
+        shedder.record_latency(10.0)
+    assert shedder.level == DegradationLevel.NORMAL
+
+
+def test_queue_depth_triggers_degradation(clock):
+    """Too many requests in flight should degrade even if latency looks fine."""
+    shedder = make_shedder(clock)
+    contexts = [shedder.track() for _ in range(5)]
+    for context in contexts:
+        context.__enter__()
+    assert shedder.in_flight == 5
+    assert shedder.level == DegradationLevel.DEFER_GRAD_CAM
+    for context in contexts:
+        context.__exit__(None, None, None)
+    assert shedder.in_flight == 0
+
+
+def test_backlog_counts_towards_queue_depth(clock):
+    """Deferred work owed to answered requests should still count as load."""
+    shedder = make_shedder(clock, backlog=lambda: 4)
+    assert shedder.pressure() == 1.0
+    shedder.request_started()
+    assert shedder.level == DegradationLevel.DEFER_GRAD_CAM
+
+
+def test_rejects_only_low_priority_keys_at_last_stage(clock):
+    """Only low-priority keys should be shed, and only at the last stage."""
+    shedder = make_shedder(clock, low_priority_keys={"low-key"})
+    assert not shedder.should_reject("low-key")
+
+    for _ in range(3):
+        shedder.record_latency(500.0)
+        clock.now += MIN_DWELL_SECONDS
+    assert shedder.level == DegradationLevel.SHED_LOW_PRIORITY
+    assert shedder.should_reject("low-key")
+    assert not shedder.should_reject("high-key")
+
+
+def test_rejected_requests_do_not_record_latency(clock):
+    """Requests finished with record=False should leave the latency window alone."""
+    shedder = make_shedder(clock)
+    started = shedder.request_started()
+    assert shedder.in_flight == 1
+    clock.now += 5
+    shedder.request_finished(started, record=False)
+    assert shedder.in_flight == 0
+    assert shedder.latency_percentile_ms() == 0.0
+
+
+def test_concurrent_requests_are_counted_in_flight(valid_api_key):
+    """
+    Requests waiting for the model should count towards queue depth, and their
+    latency should include the time spent waiting.
+    """
+    with TestClient(app):
+        load_shedder = app.state.load_shedder
+        peak_in_flight = 0
+        original_request_started = load_shedder.request_started
+
+        def request_started():
+            nonlocal peak_in_flight
+            started = original_request_started()
+            peak_in_flight = max(peak_in_flight, load_shedder.in_flight)
+            return started
+
+        load_shedder.request_started = request_started
+        with open("sample_lesion.jpg", "rb") as f:
+            image_bytes = f.read()
+
+        async def post_concurrently():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+                return await asyncio.gather(*[
+                    http.post(
+                        "/classify-lesion",
+                        headers={"X-API-Key": valid_api_key},
+                        files={"file": ("sample_lesion.jpg", image_bytes, "image/jpeg")},
+                    )
+                    for _ in range(4)
+                ])
+
+        limiter.enabled = False
+        try:
+            responses = asyncio.run(post_concurrently())
+        finally:
+            limiter.enabled = True
+
+    assert all(response.status_code == 200 for response in responses)
+    assert peak_in_flight > 1
+
+
+def test_pending_heatmap_returns_202():
+    """A deferred heatmap that hasn't been written yet should report 202, not 404."""
+    with TestClient(app) as client:
+        release = threading.Event()
+        app.state.deferred_grad_cams.submit("pending-request", release.wait)
+        try:
+            response = client.get("/heatmap/pending-request")
+        finally:
+            release.set()
+        assert response.status_code == 202
+
+
+def test_low_priority_work_waits_for_inference():
+    """Deferred work should only reach the model once no inference is waiting."""
+    order = []
+
+    async def scenario():
+        deferred = LowPriorityModelQueue()
+        deferred.start()
+        release = threading.Event()
+        first = asyncio.create_task(run_on_model(release.wait))
+        await asyncio.sleep(0)
+        deferred.submit("deferred", order.append, "deferred")
+        second = asyncio.create_task(run_on_model(order.append, "inference"))
+        await asyncio.sleep(0.05)
+        assert order == []
+        assert len(deferred) == 1
+
+        release.set()
+        await asyncio.gather(first, second)
+        while "deferred" in deferred:
+            await asyncio.sleep(0.01)
+        await deferred.close()
+
+    asyncio.run(scenario())
+    assert order == ["inference", "deferred"]
+
+
+def test_low_priority_work_dropped_under_heavy_load():
+    """Queued deferred work should be abandoned once `should_drop` says so."""
+    ran = []
+
+    async def scenario():
+        deferred = LowPriorityModelQueue(should_drop=lambda: True)
+        deferred.start()
+        deferred.submit("deferred", ran.append, "deferred")
+        await asyncio.sleep(0.05)
+        assert "deferred" not in deferred
+        await deferred.close()
+
+    asyncio.run(scenario())
+    assert ran == []
@@ -0,0 +1,224 @@
+import asyncio
+import io
+import json
+import logging
+import queue
+import sys
+
+from fastapi.testclient import TestClient
+
+from backend.main import app
+from backend.logging_setup import (
+    JsonFormatter, RequestIdFilter, RateLimitFilter, DroppingQueueHandler, RequestIdMiddleware,
+    request_id_var, setup_logging, shutdown_logging,
+)
+
+
+def make_record(name="backend.test", level=logging.INFO, msg="message %s", args=("arg",)):
+    return logging.LogRecord(name, level, __file__, 1, msg, args, None)
+
+
+def test_json_formatter_includes_request_id_and_extra_fields():
+    """
+    Tests that records carry the current request ID and any `extra` fields.
+    """
+    token = request_id_var.set("req-123")
+    try:
+        record = make_record()
+        record.stage = "full"
+        RequestIdFilter().filter(record)
+    finally:
+        request_id_var.reset(token)
+
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["message"] == "message arg"
+    assert entry["request_id"] == "req-123"
+    assert entry["logger"] == "backend.test"
+    assert entry["stage"] == "full"
+
+
+def test_rate_limit_filter_suppresses_floods(clock):
+    """
+    Tests that a flood of records from one logger is capped, other loggers are
+    unaffected, and the suppressed count is reported once records flow again.
+    """
+    rate_limit = RateLimitFilter(rate_limits={"backend.explainability": 2}, clock=clock)
+
+    passed = [rate_limit.filter(make_record("backend.explainability", logging.ERROR)) for _ in range(10)]
+    assert sum(passed) == 2
+    assert rate_limit.filter(make_record("backend.main"))
+
+    clock.now += 1
+    record = make_record("backend.explainability", logging.ERROR)
+    assert rate_limit.filter(record)
+    assert record.suppressed == 8
+
+
+def test_sampling_keeps_warnings():
+    """
+    Tests that sampling drops informational records but never warnings.
+    """
+    sampler = RateLimitFilter(sample_rates={"backend.streaming": 0.0})
+    assert not sampler.filter(make_record("backend.streaming", logging.INFO))
+    assert sampler.filter(make_record("backend.streaming", logging.WARNING))
+
+
+def test_queue_handler_drops_instead_of_blocking():
+    """
+    Tests that a full log queue drops records rather than blocking the caller,
+    and that the drop count is reported once there is room again.
+    """
+    log_queue = queue.Queue(maxsize=1)
+    handler = DroppingQueueHandler(log_queue)
+    handler.handle(make_record())
+    handler.handle(make_record())
+    handler.handle(make_record())
+    assert handler.dropped == 2
+
+    log_queue.get_nowait()
+    handler.handle(make_record())
+    assert log_queue.get_nowait().dropped == 2
+    assert handler.dropped == 0
+
+
+def test_request_id_set_before_authentication():
+    """
+    Tests that records logged during authentication carry the request ID,
+    which is also returned in the X-Request-ID header.
+    """
+    records = []
+
+    class ListHandler(logging.Handler):
+        def emit(self, record):
+            records.append(record)
+
+    with TestClient(app) as client:
+        # Added after the queue handler, so records have been tagged by then
+        list_handler = ListHandler()
+        logging.getLogger().addHandler(list_handler)
+        try:
+            with open("sample_lesion.jpg", "rb") as f:
+                response = client.post(
+                    "/classify-lesion",
+                    headers={"X-API-Key": "invalid-key"},
+                    files={"file": ("sample_lesion.jpg", f, "image/jpeg")},
+                )
+        finally:
+            logging.getLogger().removeHandler(list_handler)
+
+    warnings = [record for record in records if record.name == "backend.security"]
+    assert warnings
+    assert warnings[0].request_id == response.headers["X-Request-ID"]
+
+
+def test_unhandled_exception_logged_with_request_id():
+    """
+    Tests that the server's "Exception in ASGI application" record, logged
+    after the app has raised, still carries the failing request's ID, and
+    that the ID doesn't leak outside the request's task.
+    """
+    records = []
+
+    class ListHandler(logging.Handler):
+        def emit(self, record):
+            RequestIdFilter().filter(record)
+            records.append(record)
+
+    async def failing_app(scope, receive, send):
+        raise RuntimeError("boom")
+
+    request_ids = iter(["req-1", "req-2"])
+    middleware = RequestIdMiddleware(failing_app, generate_id=lambda: next(request_ids))
+    server_logger = logging.getLogger("uvicorn.error")
+
+    async def run_asgi():
+        # Mirrors uvicorn, which runs each request in its own task and logs
+        # anything the app raises from that task
+        try:
+            await middleware({"type": "http"}, None, None)
+        except Exception:
+            server_logger.exception("Exception in ASGI application")
+
+    async def serve():
+        await asyncio.create_task(run_asgi())
+        await asyncio.create_task(run_asgi())
+        return request_id_var.get()
+
+    list_handler = ListHandler()
+    server_logger.addHandler(list_handler)
+    try:
+        request_id_after_requests = asyncio.run(serve())
+    finally:
+        server_logger.removeHandler(list_handler)
+
+    assert [record.request_id for record in records] == ["req-1", "req-2"]
+    assert all(record.exc_info is not None for record in records)
+    assert request_id_after_requests is None
+
+
+def test_batcher_worker_has_no_request_id(valid_api_key):
+    """
+    Tests that the shared batcher worker doesn't inherit a connection's request ID.
+    """
+    seen_request_ids = []
+    with TestClient(app) as client:
+        batcher = app.state.frame_batcher
+        original_infer = batcher._infer
+
+        def infer(batch):
+            seen_request_ids.append(request_id_var.get())
+            return original_infer(batch)
+
+        batcher._infer = infer
+        with client.websocket_connect(
+            "/ws/classify-stream", headers={"X-API-Key": valid_api_key}
+        ) as websocket:
+            websocket.receive_json()
+            with open("sample_lesion.jpg", "rb") as f:
+                websocket.send_bytes(f.read())
+            assert websocket.receive_json()["type"] == "prediction"
+
+    assert seen_request_ids == [None]
+
+
+def test_invalid_api_key_is_not_logged(caplog):
+    """
+    Tests that rejected API keys never appear in the logs.
+    """
+    with TestClient(app) as client:
+        with caplog.at_level(logging.WARNING, logger="backend.security"):
+            with open("sample_lesion.jpg", "rb") as f:
+                client.post(
+                    "/classify-lesion",
+                    headers={"X-API-Key": "leaked-secret-key"},
+                    files={"file": ("sample_lesion.jpg", f, "image/jpeg")},
+                )
+    assert "Invalid API Key received" in caplog.text
+    assert "leaked-secret-key" not in caplog.text
+
+
+def test_api_key_in_url_never_reaches_log_output(monkeypatch):
+    """
+    Tests that an API key passed as a query parameter is redacted from
+    uvicorn's WebSocket handshake logs before they are written out.
+    """
+    output = io.StringIO()
+    monkeypatch.setattr(sys, "stderr", output)
+    setup_logging()
+    try:
+        # What uvicorn logs for an accepted and a rejected handshake
+        for outcome in ("[accepted]", "403"):
+            logging.getLogger("uvicorn.error").info(
+                '%s - "WebSocket %s" ' + outcome,
+                "127.0.0.1:50000",
+                "/ws/classify-stream?api_key=leaked-secret-key&rate=5",
+            )
+    finally:
+        shutdown_logging()
+
+    lines = output.getvalue().splitlines()
+    assert len(lines) == 2
+    assert "leaked-secret-key" not in output.getvalue()
+    assert json.loads(lines[0])["message"] == (
+        '127.0.0.1:50000 - "WebSocket /ws/classify-stream?api_key=[REDACTED]&rate=5" [accepted]'
+    )
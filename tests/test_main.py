@@ -39,4 +39,5 @@ def test_classify_lesion_success():
         assert "label" in data
         assert "confidence" in data
         assert "recommendation" in data
-        assert "request_id" in data 
\ No newline at end of file
+        assert "request_id" in data
+        assert data["degradation_level"] == "normal" 
\ No newline at end of file
@@ -0,0 +1,143 @@
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+from limits import parse as parse_rate_limit
+
+from backend.main import app, limiter, CLASSIFY_RATE_LIMIT, CLASSIFY_RATE_LIMIT_SCOPE
+from backend.streaming import StreamSession, MAX_UPDATE_RATE, MAX_STREAMS_PER_KEY
+
+
+def test_stream_invalid_key():
+    """
+    Tests that the streaming endpoint refuses connections with an invalid API key.
+    """
+    with TestClient(app) as client:
+        with pytest.raises(WebSocketDisconnect) as exc_info:
+            with client.websocket_connect("/ws/classify-stream?api_key=invalid-key") as websocket:
+                websocket.receive_json()
+        assert exc_info.value.code == 1008
+
+
+def test_stream_prediction_with_cam(valid_api_key):
+    """
+    Tests that a streamed frame is classified and a low-resolution CAM is
+    returned when the client asks for one.
+    """
+    with TestClient(app) as client:
+        with client.websocket_connect(
+            "/ws/classify-stream?rate=10&cam=true",
+            headers={"X-API-Key": valid_api_key},
+        ) as websocket:
+            assert websocket.receive_json() == {"type": "config", "rate": 10.0, "cam": True}
+
+            with open("sample_lesion.jpg", "rb") as f:
+                websocket.send_bytes(f.read())
+            data = websocket.receive_json()
+
+            assert data["type"] == "prediction"
+            assert "label" in data
+            assert "confidence" in data
+            assert len(data["cam"]) == 7
+            assert all(0.0 <= v <= 1.0 for row in data["cam"] for v in row)
+
+            websocket.send_bytes(b"not a jpeg")
+            assert websocket.receive_json()["type"] == "error"
+
+
+def test_stream_frames_count_in_flight_without_recording_latency(valid_api_key):
+    """
+    Tests that streamed frames add to the load shedder's queue depth but
+    leave the /classify-lesion latency window untouched.
+    """
+    in_flight_during_inference = []
+    with TestClient(app) as client:
+        load_shedder = app.state.load_shedder
+        batcher = app.state.frame_batcher
+        original_infer = batcher._infer
+
+        def infer(batch):
+            in_flight_during_inference.append(load_shedder.in_flight)
+            return original_infer(batch)
+
+        batcher._infer = infer
+        with client.websocket_connect(
+            "/ws/classify-stream", headers={"X-API-Key": valid_api_key}
+        ) as websocket:
+            websocket.receive_json()
+            with open("sample_lesion.jpg", "rb") as f:
+                websocket.send_bytes(f.read())
+            assert websocket.receive_json()["type"] == "prediction"
+
+        assert in_flight_during_inference == [1]
+        assert load_shedder.in_flight == 0
+        assert load_shedder.latency_percentile_ms() == 0.0
+
+
+def test_session_keeps_only_latest_frame():
+    """
+    Tests that frames arriving before the previous one is processed replace it.
+    """
+    session = StreamSession.from_query_params({"rate": "1000"})
+    assert session.update_rate == MAX_UPDATE_RATE
+
+    session.push_frame(b"first")
+    session.push_frame(b"second")
+    assert session.frames_received == 2
+    assert session.frames_dropped == 1
+    assert session._latest == b"second"
+
+
+def test_stream_connection_cap(valid_api_key):
+    """
+    Tests that a key can't open more than the allowed number of concurrent streams.
+    """
+    with TestClient(app) as client:
+        app.state.stream_connections[valid_api_key] = MAX_STREAMS_PER_KEY
+        with pytest.raises(WebSocketDisconnect) as exc_info:
+            with client.websocket_connect(
+                "/ws/classify-stream", headers={"X-API-Key": valid_api_key}
+            ) as websocket:
+                websocket.receive_json()
+        assert exc_info.value.code == 1013
+
+
+def test_stream_charges_rate_limit(monkeypatch, valid_api_key):
+    """
+    Tests that opening a stream is refused once the key's rate limit is used up.
+    """
+    with TestClient(app) as client:
+        monkeypatch.setattr(limiter.limiter, "hit", lambda *args: False)
+        with pytest.raises(WebSocketDisconnect) as exc_info:
+            with client.websocket_connect(
+                "/ws/classify-stream", headers={"X-API-Key": valid_api_key}
+            ) as websocket:
+                websocket.receive_json()
+        assert exc_info.value.code == 1008
+
+
+def test_stream_shares_http_rate_limit(valid_api_key):
+    """
+    Tests that opening a stream and uploading an image draw on the same
+    per-key rate limit bucket.
+    """
+    def remaining():
+        return limiter.limiter.get_window_stats(
+            parse_rate_limit(CLASSIFY_RATE_LIMIT), valid_api_key, CLASSIFY_RATE_LIMIT_SCOPE
+        ).remaining
+
+    with TestClient(app) as client:
+        before = remaining()
+        with client.websocket_connect(
+            "/ws/classify-stream", headers={"X-API-Key": valid_api_key}
+        ) as websocket:
+            websocket.receive_json()
+        assert remaining() == before - 1
+
+        with open("sample_lesion.jpg", "rb") as f:
+            response = client.post(
+                "/classify-lesion",
+                headers={"X-API-Key": valid_api_key},
+                files={"file": ("sample_lesion.jpg", f, "image/jpeg")},
+            )
+        assert response.status_code == 200
+        assert remaining() == before - 2